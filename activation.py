@@ -9,6 +9,16 @@ class Activation:
     def forward(self, X):
         self.X = X
 
+class Identity(Activation):
+    """Identity Function
+    """
+    def __init__(self):
+        super().__init__()
+    def forward(self, X):
+        return X
+    def backward(self, dY):
+        return dY
+
 class ReLU(Activation):
     """Rectified Linear Unit 
     """
@@ -55,7 +65,8 @@ class ELU(Activation):
         X = λ * X
         self.sign = (X <= 0)
         X[self.sign] = α * (np.exp(X[self.sign]) - 1.0)
-        self.Y = X
+        # keep a copy of the negative part only, the returned X may be overwritten by the next layer
+        self.Y = X[self.sign]
         return X
     def backward(self, dY, λ=1.0):
         dY = λ * dY
@@ -104,7 +115,7 @@ class Tanh(Activation):
     def __init__(self):
         super().__init__()
     def forward(self, X):
-        self.Y = 2.0/(1.0 + np.exp(-2 * X) - 1.0)
+        self.Y = 2.0/(1.0 + np.exp(-2 * X)) - 1.0
         return self.Y
     def backward(self, dY):
         dX = dY * (1.0 - (self.Y)**2)
@@ -136,6 +147,13 @@ class SoftSign(Activation):
     def backward(self, dY):
         return dY/(1.0 + self.X)**2 
 
+# Registry of the activation functions that can be used in layers.py
+# Initialize with He=====================================
+HE_ACTIVATIONS = (Identity, ReLU, LReLU, PReLU, ELU, SELU, SoftPlus)
+# Initialize with Xavier=================================
+XAVIER_ACTIVATIONS = (Sigmoid, Tanh, ArcTan, SoftSign)
+ACTIVATIONS = HE_ACTIVATIONS + XAVIER_ACTIVATIONS
+
 def Softmax(X):
     option = X.ndim
     if option == 1:
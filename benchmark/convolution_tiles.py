@@ -0,0 +1,41 @@
+"""Benchmark of the tiled (thread pool) execution of the Convolution layer
+Compares one forward + backward of the whole batch at once with the batch split into tiles on a thread pool,
+and reports the size of the largest im2col buffer for each setting.
+
+usage: python convolution_tiles.py [batch_size] [channels] [image_size]
+"""
+import sys,os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import time
+import numpy as np
+from activation import *
+from layers import *
+
+def measure(layer, X, dY, repeat=3):
+    '''Returns the best time of forward + backward in milli seconds'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layer.forward(X)
+        layer.backward(dY)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+if __name__ == '__main__':
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    channel = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    X = np.random.randn(batch, channel, size, size).astype(np.float32)
+    dY = np.random.randn(batch, channel, size, size).astype(np.float32)
+    weight = None
+    print('batch: {}, channels: {}, image: {}x{}, 3x3 same convolution'.format(batch, channel, size, size))
+    print('{:<10}{:<10}{:>10}{:>16}'.format('tile', 'threads', 'time [ms]', 'im2col [MB]'))
+    settings = [(None, None)] + [(tile, threads) for tile in (1, 4, 8) for threads in sorted({1, 2, 4, os.cpu_count()}) if tile < batch]
+    for tile, threads in settings:
+        layer = Convolution(channel, (3,3), activation=Identity(), padding='same', tile_size=tile, threads=threads)
+        layer.forward(X)
+        if weight is None:
+            weight = layer.W.weight
+        layer.W.weight = weight
+        rows = (tile or batch) * size * size * (1 if tile is None else min(threads, -(-batch//tile)))
+        print('{:<10}{:<10}{:>10.1f}{:>16.1f}'.format(str(tile or batch), str(threads or 1), measure(layer, X, dY), rows*channel*9*X.itemsize/2**20))
@@ -0,0 +1,80 @@
+"""Micro-benchmark of the per-layer Python overhead
+For small batches the time spent in the NumPy kernels is tiny, so most of the time of forward and backward is
+the Python bookkeeping of the layer (attribute access, shape handling, activation calls).
+This script measures one forward + backward of each layer and compares it with the bare NumPy kernels it runs.
+
+usage: python layer_overhead.py [batch_size]
+"""
+import sys,os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import timeit
+import numpy as np
+from activation import *
+from layers import *
+
+def measure(func, number=2000, repeat=5):
+    '''Returns the best time of one call in micro seconds'''
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+def affine(batch):
+    layer = Affine(10, activation=Identity())
+    X = np.random.randn(batch, 32)
+    dY = np.random.randn(batch, 10)
+    layer.forward(X)
+    W, B = layer.W.weight, layer.B.bias
+    def run_layer():
+        layer.forward(X)
+        layer.backward(dY)
+    def run_kernel():
+        np.dot(X, W) + B
+        np.dot(X.T, dY)
+        np.sum(dY, axis=0)
+        np.dot(dY, W.T)
+    return run_layer, run_kernel
+
+def convolution(batch):
+    layer = Convolution(4, (3,3), activation=Identity())
+    X = np.random.randn(batch, 2, 6, 6)
+    dY = np.random.randn(batch, 4, 4, 4)
+    layer.forward(X)
+    W, x = layer.W.weight, layer.x
+    def run_layer():
+        layer.forward(X)
+        layer.backward(dY)
+    def run_kernel():
+        np.tensordot(x, W.transpose(1,2,3,0), axes=3)
+        np.tensordot(dY.transpose(1,0,2,3), x, axes=3)
+        np.tensordot(dY.transpose(0,2,3,1), W, axes=1)
+    return run_layer, run_kernel
+
+def pooling(batch):
+    layer = Pooling((2,2), strides=(2,2), option='max')
+    X = np.random.randn(batch, 2, 6, 6)
+    dY = np.random.randn(batch, 2, 3, 3)
+    def run_layer():
+        layer.forward(X)
+        layer.backward(dY)
+    def run_kernel():
+        X.reshape(batch, 2, 3, 2, 3, 2).max(axis=(3,5))
+    return run_layer, run_kernel
+
+def dropout(batch):
+    layer = Dropout(0.5)
+    X = np.random.randn(batch, 32)
+    def run_layer():
+        layer.backward(layer.forward(X))
+    rng = np.random.default_rng()
+    def run_kernel():
+        mask = rng.integers(0, 65536, X.shape, dtype=np.uint16) >= 32768
+        X * mask * mask
+    return run_layer, run_kernel
+
+if __name__ == '__main__':
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    print('batch size: ' + str(batch))
+    print('{:<12}{:>12}{:>12}{:>12}'.format('layer', 'layer [us]', 'kernel [us]', 'overhead'))
+    for name, bench in (('Affine', affine), ('Convolution', convolution), ('Pooling', pooling), ('Dropout', dropout)):
+        run_layer, run_kernel = bench(batch)
+        t_layer = measure(run_layer)
+        t_kernel = measure(run_kernel)
+        print('{:<12}{:>12.1f}{:>12.1f}{:>11.0f}%'.format(name, t_layer, t_kernel, 100*(t_layer-t_kernel)/t_layer))
@@ -0,0 +1,49 @@
+"""FLOP and latency comparison of the full, grouped and depthwise-separable convolutions
+Every setting maps (batch, channels, size, size) to the same output shape with 3x3 same convolutions.
+The depthwise-separable convolution is a DepthwiseConvolution followed by a PointwiseConvolution.
+
+usage: python separable_convolution.py [batch_size] [channels] [image_size]
+"""
+import sys,os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import time
+import numpy as np
+from activation import *
+from layers import *
+
+def measure(layers, X, repeat=3):
+    '''Returns the best time of forward and forward + backward in milli seconds'''
+    best_forward, best_total = float('inf'), float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Y = X
+        for layer in layers:
+            Y = layer.forward(Y)
+        middle = time.perf_counter()
+        dY = np.ones_like(Y)
+        for layer in reversed(layers):
+            dY = layer.backward(dY)
+        end = time.perf_counter()
+        best_forward, best_total = min(best_forward, middle - start), min(best_total, end - start)
+    return best_forward * 1e3, best_total * 1e3
+
+if __name__ == '__main__':
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    channel = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 28
+    X = np.random.randn(batch, channel, size, size).astype(np.float32)
+    pixels = batch * size * size
+    settings = [
+        ('full', [Convolution(channel, (3,3), activation=Identity(), padding='same')], pixels*channel*channel*9),
+        ('groups=4', [Convolution(channel, (3,3), activation=Identity(), padding='same', groups=4)], pixels*channel*channel*9//4),
+        ('groups=C', [Convolution(channel, (3,3), activation=Identity(), padding='same', groups=channel)], pixels*channel*9),
+        ('depthwise', [DepthwiseConvolution(1, (3,3), activation=Identity(), padding='same')], pixels*channel*9),
+        ('pointwise', [PointwiseConvolution(channel, activation=Identity())], pixels*channel*channel),
+        ('separable', [DepthwiseConvolution(1, (3,3), activation=Identity(), padding='same'), PointwiseConvolution(channel, activation=Identity())], pixels*channel*(9+channel)),
+    ]
+    print('batch: {}, channels: {}, image: {}x{}'.format(batch, channel, size, size))
+    print('{:<12}{:>12}{:>10}{:>16}{:>18}'.format('layer', 'MFLOPs', 'params', 'forward [ms]', 'fwd+bwd [ms]'))
+    for name, layers, macs in settings:
+        forward, total = measure(layers, X)
+        params = sum(layer.W.weight.size for layer in layers)
+        print('{:<12}{:>12.1f}{:>10}{:>16.1f}{:>18.1f}'.format(name, 2*macs/1e6, params, forward, total))
@@ -0,0 +1,50 @@
+"""Load generator for the BatchServer in network/server.py
+Concurrent clients send single samples in a closed loop to a small model, with and without dynamic batching.
+Reports the p50/p99 latency and the throughput for each setting.
+
+usage: python serving.py [clients] [seconds]
+"""
+import sys,os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'network'))
+import asyncio
+import time
+import numpy as np
+from activation import *
+from layers import *
+from network import Sequential
+from server import BatchServer
+
+def build_model():
+    model = Sequential()
+    model.add(Affine(256, activation=ReLU(), seed=0))
+    model.add(Affine(256, activation=ReLU(), seed=1))
+    model.add(Affine(10, activation=Identity(), seed=2))
+    model.predict(np.zeros((1, 784)))
+    return model
+
+async def client(server, latencies, end):
+    X = np.random.randn(1, 784)
+    while time.monotonic() < end:
+        start = time.monotonic()
+        await server.predict('mlp', X)
+        latencies.append(time.monotonic() - start)
+
+async def run(model, clients, seconds, max_batch_size, max_latency):
+    server = BatchServer({'mlp':model}, max_batch_size=max_batch_size, max_latency=max_latency)
+    await server.start()
+    latencies = []
+    end = time.monotonic() + seconds
+    await asyncio.gather(*[client(server, latencies, end) for _ in range(clients)])
+    await server.stop()
+    return np.array(latencies)
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    model = build_model()
+    print('clients: {}, duration: {}s'.format(clients, seconds))
+    print('{:<12}{:<14}{:>10}{:>10}{:>16}'.format('max batch', 'max latency', 'p50 [ms]', 'p99 [ms]', 'throughput [/s]'))
+    for max_batch_size, max_latency in ((1, 0.0), (16, 0.002), (64, 0.002), (64, 0.01)):
+        latencies = asyncio.run(run(model, clients, seconds, max_batch_size, max_latency))
+        print('{:<12}{:<14}{:>10.2f}{:>10.2f}{:>16.0f}'.format(max_batch_size, str(max_latency*1e3)+'ms', np.percentile(latencies, 50)*1e3, np.percentile(latencies, 99)*1e3, len(latencies)/seconds))
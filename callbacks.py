@@ -0,0 +1,39 @@
+from schedule import Plateau
+
+class Callback:
+    """Base of the callbacks of Sequential.fit
+    on_validation is called with every validation metric. Setting stop to True ends the training.
+    """
+    def __init__(self):
+        self.stop = False
+    def on_validation(self, model, step, metric):
+        pass
+
+class EarlyStopping(Callback):
+    """Stops the training when the validation metric has not improved for patience validations
+    patience: Integer, the number of validations without improvement before stopping
+    mode, min_delta: see Plateau in schedule.py
+    """
+    def __init__(self, patience=5, mode='min', min_delta=0.0):
+        super().__init__()
+        self.patience = patience
+        self.plateau = Plateau(mode, min_delta)
+        self.stopped_step = None
+    def on_validation(self, model, step, metric):
+        if not self.plateau.update(metric) and self.plateau.wait >= self.patience:
+            self.stop = True
+            self.stopped_step = step
+
+class BestCheckpoint(Callback):
+    """Exports the network to path (see Sequential.export) whenever the validation metric improves
+    mode, min_delta: see Plateau in schedule.py
+    """
+    def __init__(self, path, mode='min', min_delta=0.0):
+        super().__init__()
+        self.path = path
+        self.plateau = Plateau(mode, min_delta)
+        self.best_step = None
+    def on_validation(self, model, step, metric):
+        if self.plateau.update(metric):
+            model.export(self.path)
+            self.best_step = step
@@ -0,0 +1,129 @@
+import numpy as np
+import sys
+import time
+from activation import *
+from layers import *
+
+class Alpha:
+    '''Fixes the α of an activation that takes it in forward (PReLU, ELU), so it can be checked like the others'''
+    def __init__(self, activation, α):
+        self.activation = activation
+        self.α = α
+    def forward(self, X):
+        return self.activation.forward(X, self.α)
+    def backward(self, dY):
+        return self.activation.backward(dY)
+
+def name(layer):
+    return type(layer.activation if isinstance(layer, Alpha) else layer).__name__
+
+def probe(layer, X, G, directions, eps):
+    '''Central differences of the input along the given directions in one forward
+    The perturbed inputs X ± eps*V_k are stacked along the batch axis, so all the directions are evaluated at once.
+    Returns the directional derivatives of L = sum(layer(X)*G)
+    '''
+    k = len(directions)
+    Xp = np.concatenate([X + eps*V for V in directions] + [X - eps*V for V in directions])
+    Y = layer.forward(Xp).reshape((2*k,) + G.shape)
+    L = np.sum(Y * G, axis=tuple(range(1, Y.ndim)))
+    return (L[:k] - L[k:]) / (2*eps)
+
+def probe_param(layer, X, G, param, directions, eps):
+    '''Central differences of the parameter param (updated in place) along the given directions
+    Every forward perturbs all the elements of param at once.
+    Returns the directional derivatives of L = sum(layer(X)*G)
+    '''
+    original = param.copy()
+    result = np.empty(len(directions))
+    for k, V in enumerate(directions):
+        param += eps*V
+        Lp = np.sum(layer.forward(X.copy()) * G)
+        np.copyto(param, original)
+        param -= eps*V
+        Lm = np.sum(layer.forward(X.copy()) * G)
+        np.copyto(param, original)
+        result[k] = (Lp - Lm) / (2*eps)
+    return result
+
+def relative_error(analytic, numerical):
+    scale = max(np.max(np.abs(analytic)), np.max(np.abs(numerical)), 1e-12)
+    return np.max(np.abs(analytic - numerical)) / scale
+
+def check_gradients(layer, X, directions=8, eps=1e-6, seed=None):
+    '''Compares the analytic backward of a layer (or an activation) with central differences
+    Instead of perturbing one element at a time, the input and each parameter are perturbed along random directions V,
+    and the directional derivative (L(θ+εV)-L(θ-εV))/2ε is compared with <∇L, V> from backward.
+    ## Arguments
+    layer: a layer in layers.py or an activation in activation.py
+    X: input of the layer (it is converted to float64)
+    directions: Integer, the number of random directions per checked array
+    eps: Float, the step of the central differences
+    seed: Integer, seed of the random directions
+
+    ## Output
+        Dictionary of the relative errors {'input':..., 'weight':..., 'bias':...}
+        (inf if the shape of a gradient differs from its parameter)
+    '''
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X, dtype=np.float64)
+    # analytic gradients (forward and backward may overwrite their arguments, so copies are passed)
+    Y = layer.forward(X.copy())
+    G = rng.standard_normal(Y.shape)
+    dX = layer.backward(G.copy())
+    grads = {}
+    if getattr(layer, 'has_params', lambda: False)():
+        grads = {key:np.array(value) for key, value in layer.get_grads().items()}
+        params = layer.get_params()
+
+    errors = {}
+    V = [rng.standard_normal(X.shape) for _ in range(directions)]
+    errors['input'] = relative_error(np.array([np.sum(dX*v) for v in V]), probe(layer, X, G, V, eps))
+    for key in grads:
+        if grads[key].shape != params[key].shape:
+            errors[key] = np.inf
+            continue
+        V = [rng.standard_normal(params[key].shape) for _ in range(directions)]
+        errors[key] = relative_error(np.array([np.sum(grads[key]*v) for v in V]), probe_param(layer, X, G, params[key], V, eps))
+    return errors
+
+def assert_gradients(layer, X, tolerance=1e-5, **kwargs):
+    '''Raises AssertionError if the relative error of any gradient of the layer exceeds tolerance'''
+    errors = check_gradients(layer, X, **kwargs)
+    failed = {key:error for key, error in errors.items() if not error <= tolerance}
+    if failed:
+        raise AssertionError('Gradient check of ' + name(layer) + ' failed: ' + str(failed))
+    return errors
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    image = rng.standard_normal((8, 16, 16, 16))
+    checks = [(act(), rng.standard_normal((64, 128))) for act in (Identity, ReLU, LReLU, SELU, Sigmoid, SoftPlus, Tanh, ArcTan, SoftSign)]
+    checks += [
+        (Alpha(PReLU(), 0.25), rng.standard_normal((64, 128))),
+        (Alpha(ELU(), 1.0), rng.standard_normal((64, 128))),
+        (Alpha(ELU(), 0.5), rng.standard_normal((64, 128))),
+        (Affine(100, activation=Sigmoid(), seed=0), image),
+        (Affine(100, activation=Identity(), seed=0), rng.standard_normal((32, 256))),
+        (Convolution(32, (3,3), activation=Identity(), padding='same', seed=0), image),
+        (Convolution(32, (3,3), strides=(2,2), activation=Tanh(), padding='adj', seed=0), image),
+        (Convolution(32, (3,3), activation=Identity(), padding='same', tile_size=2, channel_tile=8, seed=0), image),
+        (Convolution(32, (3,3), activation=Identity(), padding='same', groups=4, seed=0), image),
+        (DepthwiseConvolution(2, (3,3), activation=Identity(), padding='same', seed=0), image),
+        (PointwiseConvolution(32, activation=Identity(), seed=0), image),
+        (Pooling((2,2), strides=(2,2), option='max'), image),
+        (Pooling((2,2), strides=(2,2), option='ave'), image),
+        (Padding((1,2)), image),
+    ]
+    # exits with a non-zero status if any backward is wrong, so the script can gate changes of the kernels
+    failed = []
+    for layer, X in checks:
+        start = time.perf_counter()
+        try:
+            errors = assert_gradients(layer, X, seed=0)
+        except AssertionError as e:
+            print(e)
+            failed.append(name(layer))
+            continue
+        print('{:<22}{:>8.2f}s  '.format(name(layer), time.perf_counter()-start) + '  '.join('{}: {:.1e}'.format(key, error) for key, error in errors.items()))
+    if failed:
+        sys.exit('Gradient check failed: ' + ', '.join(failed))
@@ -1,23 +1,59 @@
 import numpy as np
 import math
 
+# Root of all the random streams. Every layer spawns its own child stream from here, so that a network built in the
+# same order always gets the same weights and dropout masks (also in the multi-process workers, see set_seed)
+root = np.random.SeedSequence()
+
+def set_seed(seed, worker=None):
+    """Reset the root of the random streams
+    seed: Integer, the seed shared by all the processes
+    worker: Integer, the id of the worker process (optional). Each worker gets an independent but reproducible set of streams.
+    Layers created after this call will use the new streams.
+    """
+    global root
+    if worker is None:
+        root = np.random.SeedSequence(seed)
+    else:
+        root = np.random.SeedSequence(seed, spawn_key=(worker,))
+
+def generator(seed=None):
+    """Returns a new np.random.Generator
+    seed: Integer, if given the stream only depends on this seed. Otherwise a new child stream of the root is spawned.
+    """
+    if seed is None:
+        seed = root.spawn(1)[0]
+    return np.random.Generator(np.random.PCG64(seed))
+
 class Distribution():
+    """Random number sampler drawing directly in the target dtype
+    rng: np.random.Generator to draw from (a new stream is spawned if not given)
+    dtype: dtype of the arrays to return
+    """
+    def __init__(self, rng=None, dtype=np.float64):
+        self.rng = generator() if rng is None else rng
+        self.dtype = np.dtype(dtype)
     def uniform(self, shape, low=0.0, high=1.0):
-        return np.random.uniform(low, high, shape)
+        X = self.rng.random(shape, dtype=self.dtype)
+        X *= (high - low)
+        X += low
+        return X
     def normal(self, shape, ave=0.0, stdev=1.0):
-        return np.random.normal(ave, stdev, shape)
+        X = self.rng.standard_normal(shape, dtype=self.dtype)
+        X *= stdev
+        X += ave
+        return X
     def beta(self, shape, a=2.0, b=2.0):
-        return np.random.beta(a, b, shape)
+        return self.rng.beta(a, b, shape).astype(self.dtype, copy=False)
 
 class WeightInitializer(Distribution):
-    def __init__(self, X, Y):
+    def __init__(self, shape, rng=None, dtype=np.float64):
         """
-        X: Output of the former node. X[batch_num, componet]
-        Y: Input for the next node. Y[batch_num, componet]
+        shape: (number of input nodes, number of output nodes)
         """
-        self.ilen = len(X[0])
-        self.olen = len(Y[0])
-        self.shape = [self.ilen, self.olen]
+        super().__init__(rng, dtype)
+        self.ilen, self.olen = shape
+        self.shape = (self.ilen, self.olen)
     def Xavier_uniform(self):
         high = math.sqrt(6.0/(self.ilen+self.olen))
         low = - high
@@ -35,20 +71,22 @@ class WeightInitializer(Distribution):
         var = 6.0/(self.ilen + self.olen)
         return super().normal(self.shape, ave, math.sqrt(var))
     def zero(self):
-        return np.zeros(self.shape)
+        return np.zeros(self.shape, dtype=self.dtype)
     def one(self):
-        return np.ones(self.shape)
+        return np.ones(self.shape, dtype=self.dtype)
 
 class FilterInitializer(Distribution):
-    def __init__(self, num, channel=1, hight=3, width=3):
+    def __init__(self, num, channel=1, hight=3, width=3, rng=None, dtype=np.float64):
+        super().__init__(rng, dtype)
         self.num = num
         self.channel = channel
         self.hight = hight
         self.width = width
-        self.shape = [self.num, self.channel, self.hight, self.width]
+        self.shape = (self.num, self.channel, self.hight, self.width)
     def __call__(self, X):
         self.channel = len(X[0])
+        self.shape = (self.num, self.channel, self.hight, self.width)
     def normal(self):
         return super().normal(self.shape)
     def zero(self):
-        return np.zeros(self.shape)
+        return np.zeros(self.shape, dtype=self.dtype)
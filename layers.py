@@ -1,108 +1,135 @@
+import os
 import numpy as np
 import h5py as h5
+from concurrent.futures import ThreadPoolExecutor
 from collections import OrderedDict
 from initializer import *
 from activation import *
 # ネットワークのサイズを指定されれば自動でweightとbiasを生成するモデルに変える
 # model weights are easily stored using  HDF5 format and that the network structure can be saved in either JSON or YAML format.
+class State:
+    '''Compact state of a layer
+    Every field is declared in __slots__, so that the accesses in forward and backward are plain attribute lookups
+    instead of dict lookups. Fields that are not given are set to None.
+    '''
+    __slots__ = ()
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    def __repr__(self):
+        return type(self).__name__ + '(' + ', '.join(name + '=' + repr(getattr(self, name)) for name in self.__slots__ if name not in ('input', 'output', 'delta', 'weight', 'bias')) + ')'
+
+class Data(State):
+    '''State of the input data of a layer'''
+    __slots__ = ('input', 'output', 'shape', 'delta', 'batch', 'channel', 'hight', 'width')
+
+class Weight(State):
+    '''State of the weight (or filter) of a layer'''
+    __slots__ = ('weight', 'delta', 'shape', 'patch', 'channel', 'hight', 'width')
+
+class Bias(State):
+    '''State of the bias of a layer'''
+    __slots__ = ('bias', 'delta', 'shape', 'patch', 'hight', 'width')
+
+class Size(State):
+    '''Two dimentional size such as output size, padding size and pooling window'''
+    __slots__ = ('hight', 'width')
+
+# Thread pools shared by all the tiled layers, one per number of threads
+thread_pools = {}
+
+def thread_pool(threads=None):
+    '''Returns the shared thread pool with the given number of threads (default: number of CPUs)'''
+    threads = threads or os.cpu_count()
+    if threads not in thread_pools:
+        thread_pools[threads] = ThreadPoolExecutor(max_workers=threads)
+    return thread_pools[threads]
+
+def close_thread_pools():
+    '''Shuts down the shared thread pools (they are created again when a tiled layer runs)'''
+    for threads in list(thread_pools):
+        thread_pools.pop(threads).shutdown()
+
+def weight_dtype(X):
+    '''dtype of the weights for the input X (float32 input gets float32 weights)'''
+    if X.dtype == np.float32:
+        return X.dtype
+    return np.dtype(np.float64)
+
+def check_activation(activation):
+    if not isinstance(activation, ACTIVATIONS):
+        raise TypeError('The activation function '+ str(activation) + ' is not defined in the activation.py.')
+    return activation
+
 class Layer2D:
     '''Model for fully conected layers
     '''
-    def __init__(self, layer_size, activation=ReLU()):
-        # List all the activation functions to validate the input
-        self.list_LU = []
-        self.list_S = []
-        # Initialize with He=====================================
-        self.list_LU.append(type(Identity()))
-        self.list_LU.append(type(ReLU()))
-        self.list_LU.append(type(LReLU()))
-        self.list_LU.append(type(PReLU()))
-        self.list_LU.append(type(ELU()))
-        self.list_LU.append(type(SELU()))
-        self.list_LU.append(type(SoftPlus()))
-        # Initialize with Xavier=================================
-        self.list_S.append(type(Sigmoid()))
-        self.list_S.append(type(Tanh()))
-        self.list_S.append(type(ArcTan()))
-        self.list_S.append(type(SoftSign()))
-        # No initializer is needed===============================
-        
-        if not isinstance(activation, (tuple(self.list_LU), tuple(self.list_S))):
-            raise TypeError('The activation function '+ str(activation) + ' is not defined in the activation.py.')
-        else:
-            self.act = activation
+    __slots__ = ('act', 'rng', 'X', 'W', 'B')
+
+    def __init__(self, layer_size, activation=ReLU(), seed=None):
+        self.act = check_activation(activation)
+        self.rng = generator(seed)
         
-        self.X = {'input':None, 'output':None, 'shape':None, 'delta':None, 'batch':None, 'width':None}
-        self.W = {'weight':None, 'delta':None, 'shape':None, 'hight':None, 'width':layer_size}
+        self.X = Data()
+        self.W = Weight(width=layer_size)
         # この場合hightが入力ノード数、widthが出力ノード数となる
-        self.B = {'bias':None, 'delta':None, 'shape':(1, layer_size), 'hight':1, 'width':layer_size}
+        self.B = Bias(shape=(1, layer_size), hight=1, width=layer_size)
 
     def forward(self, X):
-        self.X['input'] = X
-        self.X['shape'] = X.shape
-        self.X['batch'], self.X['width'] = X.shape
-        self.W['hight'] = self.X['width']
-        self.W['shape'] = (self.W['hight'], self.W['width'])
+        self.X.input = X
+        self.X.shape = X.shape
+        self.X.batch, self.X.width = X.shape
+        self.W.hight = self.X.width
+        self.W.shape = (self.W.hight, self.W.width)
         #初めてXが渡されたときにのみ重みを初期化する
-        if self.W['weight'] is None:
-            init = WeightInitializer(self.W['shape'])
-            if isinstance(self.act, tuple(self.list_LU)):
-                self.W['weight'] = init.He_normal()
+        if self.W.weight is None:
+            init = WeightInitializer(self.W.shape, self.rng, weight_dtype(X))
+            if isinstance(self.act, HE_ACTIVATIONS):
+                self.W.weight = init.He_normal()
                 # He_simple に変えれば少しの精度を犠牲に処理速度の向上が見込める
             else:
-                self.W['weight'] = init.Xavier_normal()
-        if self.B['bias'] is None:
-            init = WeightInitializer(self.B['shape'])
-            self.B['bias'] = init.ones()
+                self.W.weight = init.Xavier_normal()
+        if self.B.bias is None:
+            init = WeightInitializer(self.B.shape, self.rng, weight_dtype(X))
+            self.B.bias = init.one()
 
 class Layer3D:
     '''Model for 3D layer
     '''
-    def __init__(self, patch_size=None, kernel_size=(None,None), activation=ReLU()):
-        # List all the activation functions to validate the input
-        self.list_LU = []
-        self.list_S = []
-        # Initialize with He=====================================
-        self.list_LU.append(type(Identity()))
-        self.list_LU.append(type(ReLU()))
-        self.list_LU.append(type(LReLU()))
-        self.list_LU.append(type(PReLU()))
-        self.list_LU.append(type(ELU()))
-        self.list_LU.append(type(SELU()))
-        self.list_LU.append(type(SoftPlus()))
-        # Initialize with Xavier=================================
-        self.list_S.append(type(Sigmoid()))
-        self.list_S.append(type(Tanh()))
-        self.list_S.append(type(ArcTan()))
-        self.list_S.append(type(SoftSign()))
-        
-        if not isinstance(activation, (tuple(self.list_LU), tuple(self.list_S))):
-            raise TypeError('The activation function '+ str(activation) + ' is not defined in the activation.py.')
-        else:
-            self.act = activation
+    __slots__ = ('act', 'rng', 'groups', 'X', 'W', 'B')
+
+    def __init__(self, patch_size=None, kernel_size=(None,None), activation=ReLU(), seed=None, groups=1):
+        self.act = check_activation(activation)
+        self.rng = generator(seed)
+        self.groups = groups
 
-        self.X = {'input':None, 'output':None, 'shape':None, 'delta':None, 'batch':None, 'channel':None, 'hight':None, 'width':None}
-        self.W = {'weight':None, 'delta':None, 'shape':None, 'patch':patch_size, 'channel':None, 'hight':kernel_size[0], 'width':kernel_size[1]}
-        self.B = {'bias':None, 'delta':None, 'shape':(patch_size,1,1), 'patch':patch_size, 'hight':1, 'width':1}
+        self.X = Data()
+        self.W = Weight(patch=patch_size, hight=kernel_size[0], width=kernel_size[1])
+        self.B = Bias(shape=(patch_size,1,1), patch=patch_size, hight=1, width=1)
         
     def forward(self, X):
-        self.X['input'] = X
-        self.X['shape'] = X.shape
-        self.X['batch'], self.X['channel'], self.X['hight'], self.X['width'] = X.shape
-        self.W['channel'] = self.X['channel']
-        self.W['shape'] = (self.W['patch'], self.W['channel'], self.W['hight'], self.W['width'])
+        self.X.input = X
+        self.X.shape = X.shape
+        self.X.batch, self.X.channel, self.X.hight, self.X.width = X.shape
+        if self.X.channel % self.groups or self.W.patch % self.groups:
+            raise ValueError('The number of channels ' + str(self.X.channel) + ' and filters ' + str(self.W.patch) + ' must be divisible by groups ' + str(self.groups) + '.')
+        # each filter only sees the channels of its group
+        self.W.channel = self.X.channel // self.groups
+        self.W.shape = (self.W.patch, self.W.channel, self.W.hight, self.W.width)
         #初めてXが渡されたときにのみ重みを初期化する
-        if self.W['weight'] is None:
-            init = FilterInitializer(self.W['shape'])
-            self.W['weight'] = init.normal()
-        if self.B['bias'] is None:
-            self.B['bias'] = np.ones(self.B['shape'])
+        if self.W.weight is None:
+            init = FilterInitializer(*self.W.shape, rng=self.rng, dtype=weight_dtype(X))
+            self.W.weight = init.normal()
+        if self.B.bias is None:
+            self.B.bias = np.ones(self.B.shape, dtype=weight_dtype(X))
     
 class Affine(Layer2D):
     '''Affaine Layer (compatible with tensor)
     ## Arguments
     layer_size: Integer, the number of nodes to use
     activation: Activation functions to use
+    seed: Integer, seed of the random stream of this layer (optional)
 
     ## Input shape
         4D tensor with shape:
@@ -115,34 +142,43 @@ class Affine(Layer2D):
         2D tensor with shape:
             (batch_size, nodes)
     '''
-    def __init__(self, layer_size, activation=ReLU()):
-        super().__init__(layer_size, activation)
+    __slots__ = ('X_shape',)
+
+    def __init__(self, layer_size, activation=ReLU(), seed=None):
+        super().__init__(layer_size, activation, seed)
         self.X_shape = None
 
     def forward(self, X):
         self.X_shape = X.shape
         X = X.reshape(X.shape[0], -1)
         super().forward(X)
-        self.X['output'] = X
-        return self.act.forward(np.dot(self.X['output'], self.W['weight']) + self.B['bias'])
+        self.X.output = X
+        return self.act.forward(np.dot(self.X.output, self.W.weight) + self.B.bias)
 
     def backward(self, dY):
         dY = self.act.backward(dY)
-        self.W['delta'] = np.dot(self.X['output'].T, dY)
-        self.B['delta'] = np.sum(dY, axis=0)
-        return np.dot(dY, self.W['weight'].T).reshape(self.X_shape)
+        self.W.delta = np.dot(self.X.output.T, dY)
+        self.B.delta = np.sum(dY, axis=0, keepdims=True)
+        return np.dot(dY, self.W.weight.T).reshape(self.X_shape)
 
     def has_params(self):
         return True
 
     def get_params(self):
-        params = {'weight':self.W['weight'], 'bias':self.B['bias']}
+        params = {'weight':self.W.weight, 'bias':self.B.bias}
         return params
     
     def get_grads(self):
-        grads = {'weight':self.W['delta'], 'bias':self.B['delta']}
+        grads = {'weight':self.W.delta, 'bias':self.B.delta}
         return grads
 
+    def set_params(self, params):
+        self.W.weight = params['weight']
+        self.B.bias = params['bias']
+
+    def get_config(self):
+        return {'layer_size':self.W.width, 'activation':type(self.act).__name__}
+
 class Convolution(Layer3D):
     '''Convolution Layer
     ## Arguments
@@ -155,6 +191,19 @@ class Convolution(Layer3D):
         'same': zero-padding the input such that the output has the same length as the input\n
         'half': zero-padding the input such that the output has the half length of the input
     activation: Activation functions to use
+    seed: Integer, seed of the random stream of this layer (optional)
+    tile_size: Integer, the number of samples per tile (optional)
+        If given, the batch is split into tiles that are processed on a thread pool, so that the im2col buffer
+        is bounded to one tile per thread. Choose it so that tile_size*new_hight*new_width*channels*kernel_hight*kernel_width
+        elements fit in the cache.
+    channel_tile: Integer, the number of filters per tile (optional, only used with tile_size)
+        Splits the filters as well, which gives parallelism for small batches at the cost of repeating the im2col of each batch tile.
+    threads: Integer, the number of threads used for the tiles (default: number of CPUs)
+        Layers with the same number of threads share one pool (see thread_pool and close_thread_pools).
+        NumPy may also run multithreaded BLAS in every thread, so limit its threads (e.g. OMP_NUM_THREADS) when tiling.
+    groups: Integer, the number of groups (default: 1)
+        The channels and the filters are split into groups and each filter only convolves the channels of its group,
+        which divides the FLOPs and the weights by groups.
 
     ## Input shape
         4D tensor with shape:
@@ -164,64 +213,243 @@ class Convolution(Layer3D):
         4D tensor with shape:
         (batch_size, patch_size, nwe_hight, new_width)
     '''
-    def __init__(self, patch_size=None, kernel_size=(None,None), strides=(1,1), activation=ReLU(), padding='null', **kwargs):
-        super().__init__(patch_size, kernel_size, activation)
-        self.Y = {'hight':None, 'width':None}
-        self.pad = {'hight':None, 'width':None}
+    __slots__ = ('Y', 'pad', 'padding_option', 'strides', 'x', 'tile_size', 'channel_tile', 'threads')
+
+    def __init__(self, patch_size=None, kernel_size=(None,None), strides=(1,1), activation=ReLU(), padding='null', seed=None, tile_size=None, channel_tile=None, threads=None, groups=1, **kwargs):
+        super().__init__(patch_size, kernel_size, activation, seed, groups)
+        self.Y = Size()
+        self.pad = Size()
         self.padding_option = padding
         self.strides = strides
         self.x = None
+        self.tile_size = tile_size
+        self.channel_tile = channel_tile
+        self.threads = threads
     
     def forward(self, X):
         super().forward(X)
         if self.padding_option == 'same':
-            self.pad['hight'] = ((self.strides[0]-1)*self.X['hight']-self.strides[0]+self.W['hight'])
-            self.pad['width'] = ((self.strides[1]-1)*self.X['width']-self.strides[1]+self.W['width'])
+            self.pad.hight = ((self.strides[0]-1)*self.X.hight-self.strides[0]+self.W.hight)
+            self.pad.width = ((self.strides[1]-1)*self.X.width-self.strides[1]+self.W.width)
         elif self.padding_option == 'half':
-            self.pad['hight'] = ((self.strides[0]-2)*self.X['hight']//2-self.strides[0]+self.W['hight'])
-            self.pad['width'] = ((self.strides[1]-2)*self.X['width']//2-self.strides[1]+self.W['width'])
+            self.pad.hight = ((self.strides[0]-2)*self.X.hight//2-self.strides[0]+self.W.hight)
+            self.pad.width = ((self.strides[1]-2)*self.X.width//2-self.strides[1]+self.W.width)
         elif self.padding_option == 'adj':
-            self.pad['hight'] = (self.X['hight']-self.W['hight'])%self.strides[0]
-            self.pad['width'] = (self.X['width']-self.W['width'])%self.strides[1]
+            self.pad.hight = (self.X.hight-self.W.hight)%self.strides[0]
+            self.pad.width = (self.X.width-self.W.width)%self.strides[1]
         elif self.padding_option == 'null':
-            self.pad['hight'] = 0
-            self.pad['width'] = 0
-        self.X['output'] = np.pad(self.X['input'], [(0,0), (0,0), (self.pad['hight']//2, self.pad['hight']-self.pad['hight']//2), (self.pad['width']//2, self.pad['width']-self.pad['width']//2)], 'constant', constant_values=0)
+            self.pad.hight = 0
+            self.pad.width = 0
+        self.X.output = np.pad(self.X.input, [(0,0), (0,0), (self.pad.hight//2, self.pad.hight-self.pad.hight//2), (self.pad.width//2, self.pad.width-self.pad.width//2)], 'constant', constant_values=0)
 
-        self.Y['hight'] = (self.X['hight'] - self.W['hight'] + self.pad['hight'])//self.strides[0] + 1    
-        self.Y['width'] = (self.X['width'] - self.W['width'] + self.pad['width'])//self.strides[1] + 1
+        self.Y.hight = (self.X.hight - self.W.hight + self.pad.hight)//self.strides[0] + 1    
+        self.Y.width = (self.X.width - self.W.width + self.pad.width)//self.strides[1] + 1
 
-        self.x = np.zeros((self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'], self.W['hight'], self.W['width']))
-        for i in range(self.Y['hight']):
-            for j in range(self.Y['width']):
-                self.x[:,self.Y['width']*i + j,:,:,:] = self.X['output'][:,:,i*self.strides[0]:i*self.strides[0] + self.W['hight'],j*self.strides[1]:j*self.strides[1] + self.W['width']]
-        self.x = self.x.reshape(self.X['batch'], self.Y['hight'], self.Y['width'], self.X['channel'], self.W['hight'], self.W['width'])
-        return self.act.forward(np.tensordot(self.x, self.W['weight'].transpose(1,2,3,0), axes=3).transpose(0,3,1,2) + self.B['bias'])
+        if self.tile_size is None:
+            self.x = self.im2col(self.X.output)
+            Y = self.convolve(self.x, slice(None))
+        else:
+            self.x = None
+            Y = np.empty((self.X.batch, self.W.patch, self.Y.hight, self.Y.width), dtype=np.result_type(self.X.output, self.W.weight))
+            executor = thread_pool(self.threads)
+            jobs = [executor.submit(self.forward_tile, b, c, Y) for b in self.batch_tiles() for c in self.channel_tiles()]
+            for job in jobs:
+                job.result()
+        return self.act.forward(Y + self.B.bias)
 
     def backward(self, dY):
         dY = self.act.backward(dY)
-        self.B['delta'] = np.sum(dY, axis=0)
-        self.W['delta'] = np.tensordot(dY.transpose(1,0,2,3), self.x.reshape(self.X['batch'], self.Y['hight'], self.Y['width'], self.X['channel'], self.W['hight'], self.W['width']), axes=3)
-        dx = np.tensordot(dY.transpose(0,2,3,1), self.W['weight'], axes=1).reshape(self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'], self.W['hight'], self.W['width'])
-        
-        self.X['delta'] = np.zeros(self.X['output'].shape)
-        for i in range(self.Y['hight']):
-            for j in range(self.Y['width']):
-                self.X['delta'][:,:,i*self.strides[0]:i*self.strides[0] + self.W['hight'],j*self.strides[1]:j*self.strides[1] + self.W['width']] += dx[:,self.Y['width']*i + j,:,:,:]
-        self.X['delta'] = self.X['delta'][:,:,self.pad['hight']//2:self.X['hight']+self.pad['hight']//2,self.pad['width']//2:self.X['width']+self.pad['width']//2]
-        return self.X['delta']
+        self.B.delta = np.sum(dY, axis=(0,2,3)).reshape(self.B.shape)
+        self.X.delta = np.zeros(self.X.output.shape, dtype=np.result_type(dY, self.W.weight))
+        if self.tile_size is None:
+            self.W.delta = self.weight_grad(dY, self.x, slice(None))
+            self.input_grad(dY, slice(None), self.X.delta)
+        else:
+            executor = thread_pool(self.threads)
+            jobs = [executor.submit(self.backward_tile, b, dY) for b in self.batch_tiles()]
+            self.W.delta = jobs[0].result()
+            for job in jobs[1:]:
+                self.W.delta += job.result()
+        self.X.delta = self.X.delta[:,:,self.pad.hight//2:self.X.hight+self.pad.hight//2,self.pad.width//2:self.X.width+self.pad.width//2]
+        return self.X.delta
+
+    def im2col(self, X):
+        '''Returns the windows of the padded input X as a view of shape (batch, new_hight, new_width, channel, kernel_hight, kernel_width)
+        The buffer of im2col is only created in the tensordot that consumes this view.
+        '''
+        x = np.lib.stride_tricks.sliding_window_view(X, (self.W.hight, self.W.width), axis=(2,3))
+        x = x[:,:,::self.strides[0],::self.strides[1]][:,:,:self.Y.hight,:self.Y.width]
+        return x.transpose(0,2,3,1,4,5)
+
+    def col2im(self, dx, dX):
+        '''Adds the gradient of the windows dx (batch, new_hight, new_width, channel, kernel_hight, kernel_width) to the padded input gradient dX
+        '''
+        for i in range(self.W.hight):
+            for j in range(self.W.width):
+                dX[:,:,i:i+self.strides[0]*self.Y.hight:self.strides[0],j:j+self.strides[1]*self.Y.width:self.strides[1]] += dx[:,:,:,:,i,j].transpose(0,3,1,2)
+
+    def group_slices(self, c):
+        '''Returns (filters, channels) slices of each group in the filters c (a group may be cut by c)'''
+        start, stop, _ = c.indices(self.W.patch)
+        filters = self.W.patch // self.groups
+        groups = []
+        for g in range(start//filters, -(-stop//filters)):
+            groups.append((slice(max(g*filters, start), min((g+1)*filters, stop)), slice(g*self.W.channel, (g+1)*self.W.channel)))
+        return groups
+
+    def convolve(self, x, c):
+        '''Returns the output (batch, filters, new_hight, new_width) of the filters c for the windows x'''
+        Y = [np.tensordot(x[:,:,:,ch], self.W.weight[f].transpose(1,2,3,0), axes=3).transpose(0,3,1,2) for f, ch in self.group_slices(c)]
+        return Y[0] if len(Y) == 1 else np.concatenate(Y, axis=1)
+
+    def weight_grad(self, dY, x, c):
+        '''Returns the gradient of the filters c'''
+        dW = [np.tensordot(dY[:,f].transpose(1,0,2,3), x[:,:,:,ch], axes=3) for f, ch in self.group_slices(c)]
+        return dW[0] if len(dW) == 1 else np.concatenate(dW)
+
+    def input_grad(self, dY, c, dX):
+        '''Adds the input gradient through the filters c to the padded input gradient dX'''
+        for f, ch in self.group_slices(c):
+            self.col2im(np.tensordot(dY[:,f].transpose(0,2,3,1), self.W.weight[f], axes=1), dX[:,ch])
+
+    def batch_tiles(self):
+        return [slice(i, i+self.tile_size) for i in range(0, self.X.batch, self.tile_size)]
+
+    def channel_tiles(self):
+        if self.channel_tile is None:
+            return [slice(None)]
+        return [slice(i, i+self.channel_tile) for i in range(0, self.W.patch, self.channel_tile)]
+
+    def forward_tile(self, b, c, Y):
+        x = self.im2col(self.X.output[b])
+        Y[b,c] = self.convolve(x, c)
+
+    def backward_tile(self, b, dY):
+        '''Writes the input gradient of the batch tile b and returns its part of the weight gradient'''
+        x = self.im2col(self.X.output[b])
+        dW = np.empty(self.W.weight.shape, dtype=self.X.delta.dtype)
+        for c in self.channel_tiles():
+            dW[c] = self.weight_grad(dY[b], x, c)
+            self.input_grad(dY[b], c, self.X.delta[b])
+        return dW
 
     def has_params(self):
         return True
 
     def get_params(self):
-        params = {'weight':self.W['weight'], 'bias':self.B['bias']}
+        params = {'weight':self.W.weight, 'bias':self.B.bias}
         return params
     
     def get_grads(self):
-        grads = {'weight':self.W['delta'], 'bias':self.B['delta']}
+        grads = {'weight':self.W.delta, 'bias':self.B.delta}
         return grads
 
+    def set_params(self, params):
+        self.W.weight = params['weight']
+        self.B.bias = params['bias']
+
+    def get_config(self):
+        return {'patch_size':self.W.patch, 'kernel_size':(self.W.hight, self.W.width), 'strides':self.strides, 'padding':self.padding_option,
+                'activation':type(self.act).__name__, 'tile_size':self.tile_size, 'channel_tile':self.channel_tile, 'threads':self.threads, 'groups':self.groups}
+
+class DepthwiseConvolution(Convolution):
+    '''Depthwise Convolution Layer
+    Convolves every channel with its own filters, which is Convolution with groups equal to the number of channels.
+    The output is computed as per-channel einsums over the strided windows of the input (one per kernel position),
+    so the (channels*kernel_hight*kernel_width) im2col matrix is never built.
+    ## Arguments
+    multiplier: Integer, the number of filters per channel
+    kernel_size, strides, padding, activation, seed, tile_size, threads: see Convolution
+
+    ## Input shape
+        4D tensor with shape:
+        (batch_size, channels, hight, width)
+
+    ## Output shape
+        4D tensor with shape:
+        (batch_size, channels*multiplier, nwe_hight, new_width)
+    '''
+    __slots__ = ('multiplier',)
+
+    def __init__(self, multiplier=1, kernel_size=(None,None), strides=(1,1), activation=ReLU(), padding='null', seed=None, tile_size=None, threads=None, **kwargs):
+        super().__init__(None, kernel_size, strides=strides, activation=activation, padding=padding, seed=seed, tile_size=tile_size, threads=threads)
+        self.multiplier = multiplier
+
+    def forward(self, X):
+        # the number of groups and filters follow the channels of the input
+        self.groups = X.shape[1]
+        self.W.patch = self.B.patch = X.shape[1] * self.multiplier
+        self.B.shape = (self.W.patch, 1, 1)
+        return super().forward(X)
+
+    def convolve(self, x, c):
+        # x[:,:,:,:,i,j] is the strided view of the input under the kernel position (i, j)
+        W = self.W.weight.reshape(self.groups, self.multiplier, self.W.hight, self.W.width)
+        Y = np.zeros((len(x), self.groups, self.multiplier, self.Y.hight, self.Y.width), dtype=np.result_type(x, W))
+        for i in range(self.W.hight):
+            for j in range(self.W.width):
+                Y += np.einsum('bhwc,cm->bcmhw', x[:,:,:,:,i,j], W[:,:,i,j])
+        return Y.reshape(len(x), self.W.patch, self.Y.hight, self.Y.width)
+
+    def weight_grad(self, dY, x, c):
+        dY = dY.reshape(len(dY), self.groups, self.multiplier, self.Y.hight, self.Y.width)
+        dW = np.empty((self.groups, self.multiplier, self.W.hight, self.W.width), dtype=np.result_type(dY, x))
+        for i in range(self.W.hight):
+            for j in range(self.W.width):
+                dW[:,:,i,j] = np.einsum('bcmhw,bhwc->cm', dY, x[:,:,:,:,i,j])
+        return dW.reshape(self.W.weight.shape)
+
+    def input_grad(self, dY, c, dX):
+        dY = dY.reshape(len(dY), self.groups, self.multiplier, self.Y.hight, self.Y.width)
+        W = self.W.weight.reshape(self.groups, self.multiplier, self.W.hight, self.W.width)
+        for i in range(self.W.hight):
+            for j in range(self.W.width):
+                dX[:,:,i:i+self.strides[0]*self.Y.hight:self.strides[0],j:j+self.strides[1]*self.Y.width:self.strides[1]] += np.einsum('bcmhw,cm->bchw', dY, W[:,:,i,j])
+
+    def get_config(self):
+        return {'multiplier':self.multiplier, 'kernel_size':(self.W.hight, self.W.width), 'strides':self.strides, 'padding':self.padding_option,
+                'activation':type(self.act).__name__, 'tile_size':self.tile_size, 'threads':self.threads}
+
+class PointwiseConvolution(Convolution):
+    '''Pointwise Convolution Layer
+    1x1 convolution that mixes the channels at every pixel. It is computed as a plain GEMM of the filters (patch_size, channels)
+    and the input (channels, hight*width) of each sample, without padding nor im2col.
+    ## Arguments
+    patch_size: Integer, the number of filters to use
+    activation, seed: see Convolution
+
+    ## Input shape
+        4D tensor with shape:
+        (batch_size, channels, hight, width)
+
+    ## Output shape
+        4D tensor with shape:
+        (batch_size, patch_size, hight, width)
+    '''
+    __slots__ = ()
+
+    def __init__(self, patch_size=None, activation=ReLU(), seed=None, **kwargs):
+        super().__init__(patch_size, (1,1), activation=activation, seed=seed)
+
+    def forward(self, X):
+        Layer3D.forward(self, X)
+        self.X.output = self.X.input
+        self.Y.hight, self.Y.width = self.X.hight, self.X.width
+        self.pad.hight = self.pad.width = 0
+        Y = np.matmul(self.W.weight[:,:,0,0], X.reshape(self.X.batch, self.X.channel, -1))
+        return self.act.forward(Y.reshape(self.X.batch, self.W.patch, self.Y.hight, self.Y.width) + self.B.bias)
+
+    def backward(self, dY):
+        dY = self.act.backward(dY)
+        self.B.delta = np.sum(dY, axis=(0,2,3)).reshape(self.B.shape)
+        dY = dY.reshape(self.X.batch, self.W.patch, -1)
+        self.W.delta = np.tensordot(dY, self.X.input.reshape(self.X.batch, self.X.channel, -1), axes=((0,2),(0,2))).reshape(self.W.shape)
+        self.X.delta = np.matmul(self.W.weight[:,:,0,0].T, dY).reshape(self.X.shape)
+        return self.X.delta
+
+    def get_config(self):
+        return {'patch_size':self.W.patch, 'activation':type(self.act).__name__}
+
 class Padding:
     '''Padding Layer
     ## Arguments
@@ -236,20 +464,19 @@ class Padding:
         4D tensor with shape:
         (batch_size, channels, padded_hight, padded_width)
     '''
+    __slots__ = ('pad', 'pad_val', 'X_shape')
+
     def __init__(self, pad_size=(None,None), pad_value=0):
-        self.pad = {'hight':pad_size[0], 'width':pad_size[1]}
+        self.pad = Size(hight=pad_size[0], width=pad_size[1])
         self.pad_val = pad_value
-        self.option = option
         self.X_shape = None
 
     def forward(self, X):
         self.X_shape = X.shape
-        return np.pad(X, [(0,0),(0,0),(self.pad['hight'], self.pad['hight']),(self.pad['width'], self.pad['width'])], 'constant', constant_values=self.pad_val)
+        return np.pad(X, [(0,0),(0,0),(self.pad.hight, self.pad.hight),(self.pad.width, self.pad.width)], 'constant', constant_values=self.pad_val)
 
     def backward(self, dY):
-        dX = np.zeros(self.X_shape)
-        dX = dY[:,:,self.pad['hight']:self.X_shape[2]-self.pad['hight'],self.pad['width']:self.X_shape[3]-self.pad['width']]
-        return dX
+        return dY[:,:,self.pad.hight:self.pad.hight+self.X_shape[2],self.pad.width:self.pad.width+self.X_shape[3]]
 
     def has_params(self):
         return False
@@ -260,6 +487,9 @@ class Padding:
     def get_grads(self):
         pass
 
+    def get_config(self):
+        return {'pad_size':(self.pad.hight, self.pad.width), 'pad_value':self.pad_val}
+
 class Pooling:
     '''Pooling Layer
     ## Arguments
@@ -274,71 +504,73 @@ class Pooling:
         'same': zero-padding the input such that the output has the same length as the input\n
         'half': zero-padding the input such that the output has the half length of the input
     '''
+    __slots__ = ('X', 'Y', 'pool', 'strides', 'option', 'pad', 'padding_option', 'x')
+
     def __init__(self, pool=(None,None), strides=(None,None), option='max', padding='null', **kwargs):
-        self.X = {'input':None, 'output':None, 'shape':None, 'delta':None, 'batch':None, 'channel':None, 'hight':None, 'width':None}
-        self.Y = {'hight':None, 'width':None}
-        self.pool = {'hight':pool[0], 'width':pool[1]}
+        self.X = Data()
+        self.Y = Size()
+        self.pool = Size(hight=pool[0], width=pool[1])
         self.strides = strides
         self.option = option
-        self.pad = {'hight':None, 'width':None}
+        self.pad = Size()
         self.padding_option = padding
 
         self.x = None
 
     def forward(self, X):
-        self.X['input'] = X
-        self.X['shape'] = X.shape
-        self.X['batch'], self.X['channel'], self.X['hight'], self.X['width'] = X.shape
+        self.X.input = X
+        self.X.shape = X.shape
+        self.X.batch, self.X.channel, self.X.hight, self.X.width = X.shape
 
         if self.padding_option == 'same':
-            self.pad['hight'] = ((self.strides[0]-1)*self.X['hight']-self.strides[0]+self.pool['hight'])
-            self.pad['width'] = ((self.strides[1]-1)*self.X['width']-self.strides[1]+self.pool['width'])
+            self.pad.hight = ((self.strides[0]-1)*self.X.hight-self.strides[0]+self.pool.hight)
+            self.pad.width = ((self.strides[1]-1)*self.X.width-self.strides[1]+self.pool.width)
         elif self.padding_option == 'half':
-            self.pad['hight'] = ((self.strides[0]-2)*self.X['hight']//2-self.strides[0]+self.pool['hight'])
-            self.pad['width'] = ((self.strides[1]-2)*self.X['width']//2-self.strides[1]+self.pool['width'])
+            self.pad.hight = ((self.strides[0]-2)*self.X.hight//2-self.strides[0]+self.pool.hight)
+            self.pad.width = ((self.strides[1]-2)*self.X.width//2-self.strides[1]+self.pool.width)
         elif self.padding_option == 'adj':
-            self.pad['hight'] = (self.X['hight']-self.pool['hight'])%self.strides[0]
-            self.pad['width'] = (self.X['width']-self.pool['width'])%self.strides[1]
+            self.pad.hight = (self.X.hight-self.pool.hight)%self.strides[0]
+            self.pad.width = (self.X.width-self.pool.width)%self.strides[1]
         elif self.padding_option == 'null':
-            self.pad['hight'] = 0
-            self.pad['width'] = 0
-        self.X['input'] = np.pad(self.X['input'], [(0,0), (0,0), (self.pad['hight']//2, self.pad['hight']-self.pad['hight']//2), (self.pad['width']//2, self.pad['width']-self.pad['width']//2)], 'constant', constant_values=0)
+            self.pad.hight = 0
+            self.pad.width = 0
+        self.X.input = np.pad(self.X.input, [(0,0), (0,0), (self.pad.hight//2, self.pad.hight-self.pad.hight//2), (self.pad.width//2, self.pad.width-self.pad.width//2)], 'constant', constant_values=0)
 
-        self.Y['hight'] = (self.X['hight'] - self.pool['hight'] + self.pad['hight'])//self.strides[0] + 1    
-        self.Y['width'] = (self.X['width'] - self.pool['width'] + self.pad['width'])//self.strides[1] + 1
+        self.Y.hight = (self.X.hight - self.pool.hight + self.pad.hight)//self.strides[0] + 1    
+        self.Y.width = (self.X.width - self.pool.width + self.pad.width)//self.strides[1] + 1
         
-        self.x = np.zeros((self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'], self.pool['hight'], self.pool['width']))
+        self.x = np.zeros((self.X.batch, self.Y.hight*self.Y.width, self.X.channel, self.pool.hight, self.pool.width))
 
-        for i in range(self.Y['hight']):
-            for j in range(self.Y['width']):
-                self.x[:,self.Y['width']*i + j,:,:,:] = self.X['input'][:,:,i*self.strides[0]:i*self.strides[0] + self.pool['hight'],j*self.strides[1]:j*self.strides[1] + self.pool['width']]
-        self.X['output'] = self.x.reshape(self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'], self.pool['hight']*self.pool['width'])
+        for i in range(self.Y.hight):
+            for j in range(self.Y.width):
+                self.x[:,self.Y.width*i + j,:,:,:] = self.X.input[:,:,i*self.strides[0]:i*self.strides[0] + self.pool.hight,j*self.strides[1]:j*self.strides[1] + self.pool.width]
+        self.X.output = self.x.reshape(self.X.batch, self.Y.hight*self.Y.width, self.X.channel, self.pool.hight*self.pool.width)
         if self.option == 'max': # max pooloing
-            self.x = np.max(self.X['output'], axis=3).transpose(0,2,1)
+            self.x = np.max(self.X.output, axis=3).transpose(0,2,1)
         elif self.option == 'ave': # average pooling
-            self.x = np.average(self.X['output'], axis=3).transpose(0,2,1)
-        return self.x.reshape(self.X['batch'], self.X['channel'], self.Y['hight'], self.Y['width'])
+            self.x = np.average(self.X.output, axis=3).transpose(0,2,1)
+        return self.x.reshape(self.X.batch, self.X.channel, self.Y.hight, self.Y.width)
     
     def backward(self, dY):
-        dY = dY.reshape(self.X['batch'], self.X['channel'],-1).transpose(0,2,1)
-        dx = np.zeros((self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'], self.pool['hight']*self.pool['width']))
+        dY = dY.reshape(self.X.batch, self.X.channel,-1).transpose(0,2,1)
+        dx = np.zeros((self.X.batch, self.Y.hight*self.Y.width, self.X.channel, self.pool.hight*self.pool.width))
         if self.option == 'max':# max pooloing
-            index = np.argmax(self.X['output'], axis=3).reshape(1,-1)[0]
+            index = np.argmax(self.X.output, axis=3).reshape(1,-1)[0]
             dY = dY.reshape(1,-1)[0]
-            dx = dx.reshape(-1, self.pool['hight']*self.pool['width'])
+            dx = dx.reshape(-1, self.pool.hight*self.pool.width)
             for i in range(len(index)):
                 dx[i,index[i]] = dY[i]
         elif self.option == 'ave':# average pooling
-            dY = dY.reshape(self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'],1)
-            dx = dx + dY
+            dY = dY.reshape(self.X.batch, self.Y.hight*self.Y.width, self.X.channel,1)
+            dx = dx + dY/(self.pool.hight*self.pool.width)
         
-        dx = dx.reshape(self.X['batch'], self.Y['hight']*self.Y['width'], self.X['channel'], self.pool['hight'], self.pool['width'])
-        self.X['delta'] =  np.zeros(self.X['input'].shape)
-        for i in range(self.Y['hight']):
-            for j in range(self.Y['width']):
-                self.X['delta'][:,:,i*self.strides[0]:i*self.strides[0] + self.pool['hight'],j*self.strides[1]:j*self.strides[1] + self.pool['width']] += dx[:,self.Y['width']*i + j,:,:,:]
-        self.X['delta'] = self.X['delta'][:,:,self.pad['hight']//2:self.X['hight']+self.pad['hight']//2,self.pad['width']//2:self.X['width']+self.pad['width']//2]
-        return self.X['delta']
+        dx = dx.reshape(self.X.batch, self.Y.hight*self.Y.width, self.X.channel, self.pool.hight, self.pool.width)
+        self.X.delta =  np.zeros(self.X.input.shape)
+        for i in range(self.Y.hight):
+            for j in range(self.Y.width):
+                self.X.delta[:,:,i*self.strides[0]:i*self.strides[0] + self.pool.hight,j*self.strides[1]:j*self.strides[1] + self.pool.width] += dx[:,self.Y.width*i + j,:,:,:]
+        self.X.delta = self.X.delta[:,:,self.pad.hight//2:self.X.hight+self.pad.hight//2,self.pad.width//2:self.X.width+self.pad.width//2]
+        return self.X.delta
 
     def has_params(self):
         return False
@@ -349,27 +581,45 @@ class Pooling:
     def get_grads(self):
         pass
 
+    def get_config(self):
+        return {'pool':(self.pool.hight, self.pool.width), 'strides':self.strides, 'option':self.option, 'padding':self.padding_option}
+
 class Dropout:
-    """Dropout Layer
+    """Dropout Layer (inverted dropout)
+    The kept units are scaled by 1/(1-dropout_rate) while training, so that predict does not need any scaling.
+    The mask is stored as a boolean array drawn from 16 bit random integers.
     ## Arguments 
-    dropout_rate: set the dropout rate
+    dropout_rate: set the dropout rate (probability of dropping a unit)
+    seed: Integer, seed of the random stream of this layer (optional)
     """
-    def __init__(self, dropout_rate=0.5):
-        self.rate = dropout_rate
-        self.mask = None    
+    __slots__ = ('rate', 'scale', 'threshold', 'rng', 'mask')
+
+    def __init__(self, dropout_rate=0.5, seed=None):
+        self.rng = generator(seed)
+        self.mask = None
+        self(dropout_rate)
 
     def __call__(self, dropout_rate=0.5):
+        if not 0.0 <= dropout_rate < 1.0:
+            raise ValueError('The dropout rate must be in [0, 1). Given: ' + str(dropout_rate))
         self.rate = dropout_rate
+        self.scale = 1.0/(1.0 - dropout_rate)
+        # a unit is kept if the 16 bit random integer is not smaller than this value
+        self.threshold = int(round(dropout_rate * 65536))
 
     def forward(self, X):
-        self.mask = np.random.rand(*X.shape) < self.rate
-        return X * self.mask
+        self.mask = self.rng.integers(0, 65536, X.shape, dtype=np.uint16, endpoint=False) >= self.threshold
+        Y = np.multiply(X, self.scale, dtype=X.dtype)
+        Y *= self.mask
+        return Y
     
     def predict(self, X):
-        return X * self.rate
+        return X
 
     def backward(self, dY):
-        return dY * self.mask
+        dX = np.multiply(dY, self.scale, dtype=dY.dtype)
+        dX *= self.mask
+        return dX
 
     def has_params(self):
         return False
@@ -379,3 +629,6 @@ class Dropout:
     
     def get_grads(self):
         pass
+
+    def get_config(self):
+        return {'dropout_rate':self.rate}
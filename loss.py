@@ -33,3 +33,22 @@ def CEL(X, T):
         Loss of the whole mini-batch (one value will be returned)
     """
     return -np.sum(T*np.log(np.absolute(X+10e-7)))/X.shape[0]
+
+def MAE_backward(X, T):
+    """Derivative of MAE with respect to X"""
+    return np.sign(X-T)/X.shape[0]
+
+def MSE_backward(X, T):
+    """Derivative of MSE with respect to X"""
+    return 2.0*(X-T)/X.shape[0]
+
+def RMSE_backward(X, T):
+    """Derivative of RMSE with respect to X"""
+    return (X-T)/(X.shape[0]*max(RMSE(X, T), 10e-7))
+
+def CEL_backward(X, T):
+    """Derivative of CEL with respect to X"""
+    return -T/((X+10e-7)*X.shape[0])
+
+# Derivative of each loss function, used to start the backpropagation
+GRADIENTS = {MAE:MAE_backward, MSE:MSE_backward, RMSE:RMSE_backward, CEL:CEL_backward}
@@ -1,4 +1,7 @@
 from collections import OrderedDict
+import json
+import struct
+import tempfile
 
 import sys,os
 sys.path.append(os.pardir)
@@ -8,100 +11,262 @@ from activation import *
 from layers import *
 from optimizer import *
 from initializer import *
+from schedule import *
+from callbacks import *
 
 # model weights are easily stored using  HDF5 format and that the network structure can be saved in either JSON or YAML format.
 
+# List all the layers to validate the input
+LAYERS = (Affine, Convolution, DepthwiseConvolution, PointwiseConvolution, Pooling, Padding, Dropout)
+#Maxout, BatchNormalization, Skip
+
+# List all the optimizer to validate the input
+OPTIMIZERS = (SGD, Momentum, AdaGrad)
+#Nesterov_Momentum, RMSprop, Adam, Adamdelta, AdaMax, Nadam
+
+# File format of Sequential.export:
+#   MAGIC | length of the header (uint64, little endian) | JSON header | padding | weights
+# Every weight array starts at an offset aligned to ALIGNMENT bytes from the start of the weights.
+MAGIC = b'SDLMODEL'
+ALIGNMENT = 64
+
 class Sequential:
     '''
     ## Methods
     add: add a new layer to the neural network
     compile: add optimizer and loss function
     predict: process the input without learning (without updating the weights)
-    evaluate: get the accuracy of the network
+    train: update the weights with one batch
+    fit: train the network for several epochs with validation, learning rate schedules and callbacks
+    evaluate: get the loss of the network
     gradient: 
+    export: save the structure and the weights of the network into one file
+    load: rebuild a network saved with export (the weights can be memory mapped)
     load_weight: 
     save_weight: 
     '''
     def __init__(self):
-        # List all the layers to validate the input
-        self.list_layer = []
-        self.list_layer.append(type(Affine()))
-        self.list_layer.append(type(Convolution()))
-        self.list_layer.append(type(Pooling()))
-        self.list_layer.append(type(Pading()))
-        self.list_layer.append(type(Dropuot()))
-        #self.list_layer.append(type(Maxout()))
-        #self.list_layer.append(type(BatchNormalization()))
-        #self.list_layer.append(type(Skip()))
-
-        # List all the optimizer to validate the input
-        self.list_opt = []
-        self.list_opt.append(type(SGD()))
-        self.list_opt.append(type(Momentum()))
-        #self.list_opt.append(type(Nesterov_Momentum()))
-        self.list_opt.append(type(AdaGrad()))
-        #self.list_opt.append(type(RMSprop()))
-        #self.list_opt.append(type(Adam()))
-        #self.list_opt.append(type(Adamdelta()))
-        #self.list_opt.append(type(AdaMax()))
-        #self.list_opt.append(type(Nadam()))
-
         self.layers = OrderedDict()
         self.params = {}
         self.grads = {}
         self.opt = None
+        self.loss = None
 
     def add(self, layer):
-        if not isinstance(layer, tuple(self.list_layer)):
+        if not isinstance(layer, LAYERS):
             raise TypeError('The layer' +str(len(self.layers)) +' must be a layer class definened in layers.py. Not found: ' +str(layer))
         else:
             ly = layer
             self.layers.update({str(len(self.layers)):{'layer':ly, 'X':None, 'dY':None}})
 
     def compile(self, optimizer, loss):
-        if not isinstance(optimizer, tuple(self.list_opt)):
-            raise TypeError('The optimizer ' +str(optimizer)) + ' is not defined.')
+        if not isinstance(optimizer, OPTIMIZERS):
+            raise TypeError('The optimizer ' +str(optimizer) + ' is not defined.')
         else:
             self.opt = optimizer
+        if loss not in GRADIENTS:
+            raise TypeError('The loss function ' + str(loss) + ' is not defined in loss.py.')
+        self.loss = loss
 
         #交差エントロピー誤差が入力されれば、出力層に「ソフトマックス関数」を設定
         #二乗和誤差MSEが入力されれば、出力層に恒等関数を設定する
 
     def predict(self, X):
-        self.layers['0']['X'] = X
         for i in range(len(self.layers)):
-            self.layers[str(i+1)]['X'] = self.layers[str(i)]['layer'].forward(self.layers[str(i)]['X'])
-        return self.layers[str(len(self.layers)-1)]['X']
+            layer = self.layers[str(i)]['layer']
+            # Dropout uses predict instead of forward
+            X = layer.predict(X) if hasattr(layer, 'predict') else layer.forward(X)
+        return X
 
         #ニューラルネットワークの推論で答えを一つだけ出力する場合は、スコアの最大値のみが必要なので、Softmaxレイヤは不必要
     
-    def train(self, X, T):
-        # forward
-        self.layers['0']['X'] = X
-        for i in range(len(self.layers)-1):
-            self.layers[str(i+1)]['X'] = self.layers[str(i)]['layer'].forward(self.layers[str(i)]['X'])
-        self.layers[str(len(self.layers)-1)]['layer'].forward(self.layers[str(len(self.layers)-1)]['X'])
-        
+    def train(self, X, T, accumulate_steps=1):
+        '''
+        accumulate_steps: Integer, the number of micro-batches the batch is split into.
+            The gradients of the micro-batches are summed into persistent buffers and the optimizer is called once,
+            which gives the same update as the whole batch with the peak memory of one micro-batch.
+            It is capped at the batch size, so that no micro-batch is empty.
+            (RMSE is not a sum over the samples, so its update is only close to the whole batch)
+        '''
+        if accumulate_steps < 1:
+            raise ValueError('accumulate_steps must be at least 1. Given: ' + str(accumulate_steps))
+        accumulate_steps = min(accumulate_steps, len(X))
+        if accumulate_steps == 1:
+            self.forward_backward(X, T)
+            # get all the gradient
+            for i in self.layers:
+                if self.layers[i]['layer'].has_params() == True:
+                    self.grads[i] = self.layers[i]['layer'].get_grads()
+        else:
+            for step, (x, t) in enumerate(zip(np.array_split(X, accumulate_steps), np.array_split(T, accumulate_steps))):
+                self.forward_backward(x, t, len(x)/len(X))
+                # accumulate all the gradient
+                for i in self.layers:
+                    if self.layers[i]['layer'].has_params() == True:
+                        grads = self.layers[i]['layer'].get_grads()
+                        if step == 0:
+                            if i in self.grads and self.is_buffer(self.grads[i], grads):
+                                for key in grads:
+                                    np.copyto(self.grads[i][key], grads[key])
+                            else:
+                                self.grads[i] = {key:np.array(grads[key]) for key in grads}
+                        else:
+                            for key in grads:
+                                self.grads[i][key] += grads[key]
+
         # get all the parameters
         for i in self.layers:
             if self.layers[i]['layer'].has_params() == True:
                 self.params[i] = self.layers[i]['layer'].get_params()
+
+        self.opt.optimize(self.params, self.grads)
+
+    def is_buffer(self, buffer, grads):
+        '''Checks if the gradient buffer can hold the grads in place'''
+        for key in grads:
+            if buffer[key] is grads[key] or buffer[key].shape != grads[key].shape or buffer[key].dtype != grads[key].dtype:
+                return False
+        return True
+
+    def forward_backward(self, X, T, scale=1.0):
+        '''
+        scale: Float, the share of X in the whole batch (the loss is normalized by the size of the whole batch)
+        '''
+        # forward
+        self.layers['0']['X'] = X
+        for i in range(len(self.layers)-1):
+            self.layers[str(i+1)]['X'] = self.layers[str(i)]['layer'].forward(self.layers[str(i)]['X'])
+        Y = self.layers[str(len(self.layers)-1)]['layer'].forward(self.layers[str(len(self.layers)-1)]['X'])
         
-        #最終的に得られる誤差をバッチ数で割って正規化してから逆伝播するように修正する
-        self.layers[str(len(self.layers)-1)]['dY'] = T
+        # the backpropagation starts from the derivative of the loss, normalized by the batch size
+        self.layers[str(len(self.layers)-1)]['dY'] = GRADIENTS[self.loss](Y, T) * scale
         for i in range(len(self.layers)-1):
             self.layers[str(len(self.layers)-i-2)]['dY'] = self.layers[str(len(self.layers)-i-1)]['layer'].backward(self.layers[str(len(self.layers)-i-1)]['dY'])
         self.layers['0']['layer'].backward(self.layers['0']['dY'])
+    
+    def evaluate(self, X, T, batch_size=256):
+        '''Returns the loss of the whole data set
+        The loss is accumulated batch by batch, so that the predictions of the whole data set are never held at once.
+        '''
+        total = 0.0
+        for i in range(0, len(X), batch_size):
+            total += self.loss(self.predict(X[i:i+batch_size]), T[i:i+batch_size]) * len(X[i:i+batch_size])
+        return total / len(X)
 
-        # get all the gradient
-        for i in self.layers:
-            if self.layers[i]['layer'].has_params() == True:
-                self.grads[i] = self.layers[i]['layer'].get_grads()
+    def fit(self, X, T, epochs=1, batch_size=32, validation_data=None, validation_interval=None, callbacks=(), accumulate_steps=1, seed=None):
+        '''Trains the network with shuffled mini-batches to minimize the loss given to compile
+        validation_data: Tuple (X, T) evaluated with evaluate (optional)
+        validation_interval: Integer, validate every this number of steps (default: at the end of every epoch)
+        callbacks: Callbacks in callbacks.py, called with every validation metric (e.g. EarlyStopping, BestCheckpoint)
+            The validation metric is also fed to the learning rate schedule of the optimizer (e.g. ReduceOnPlateau).
+        accumulate_steps: see train
+        seed: Integer, seed of the shuffling
 
-        self.opt.optimize(self.params, self.grads)
-    
-    def evaluate(self, X, T):
-        pass
+        ## Output
+            List of (step, validation metric)
+        '''
+        rng = generator(seed)
+        history = []
+        step = 0
+        for epoch in range(epochs):
+            index = rng.permutation(len(X))
+            for i in range(0, len(X), batch_size):
+                self.train(X[index[i:i+batch_size]], T[index[i:i+batch_size]], accumulate_steps)
+                step += 1
+                last = i + batch_size >= len(X)
+                if validation_data is not None and (step % validation_interval == 0 if validation_interval else last):
+                    metric = self.evaluate(*validation_data)
+                    history.append((step, metric))
+                    if hasattr(self.opt.learning_rate, 'update'):
+                        self.opt.learning_rate.update(metric)
+                    for callback in callbacks:
+                        callback.on_validation(self, step, metric)
+                    if any(callback.stop for callback in callbacks):
+                        return history
+        return history
+
+    def export(self, path):
+        '''Saves the layer graph as JSON and all the weights as one aligned flat binary blob in the file path
+        The weights are created at the first forward, so the network must have been run at least once.
+        The file is replaced atomically, so it can be exported again while other processes have it memory mapped.
+        '''
+        header = {'layers':[]}
+        arrays = []
+        offset = 0
+        for i in range(len(self.layers)):
+            layer = self.layers[str(i)]['layer']
+            entry = {'type':type(layer).__name__, 'config':layer.get_config(), 'params':{}}
+            if layer.has_params():
+                for key, value in layer.get_params().items():
+                    if value is None:
+                        raise ValueError('The weights of the layer' + str(i) + ' are not initialized. Run the network once before export.')
+                    value = np.ascontiguousarray(value)
+                    offset = -(-offset//ALIGNMENT)*ALIGNMENT
+                    entry['params'][key] = {'offset':offset, 'shape':value.shape, 'dtype':value.dtype.str}
+                    arrays.append((offset, value))
+                    offset += value.nbytes
+            header['layers'].append(entry)
+        header['size'] = offset
+        header = json.dumps(header).encode('utf-8')
+        start = -(-(len(MAGIC) + 8 + len(header))//ALIGNMENT)*ALIGNMENT
+        # write to a temporary file and replace path at once, so that processes mapping the old file never see it truncated
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.' + os.path.basename(path) + '.')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(MAGIC + struct.pack('<Q', len(header)) + header)
+                for position, value in arrays:
+                    file.seek(start + position)
+                    file.write(value.tobytes())
+                file.truncate(start + offset)
+            # mkstemp creates the file with 0600, so keep the mode of the replaced file (or the default one of a new file)
+            if os.path.exists(path):
+                mode = os.stat(path).st_mode & 0o7777
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temporary, mode)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''Rebuilds a network saved with export
+        mmap: if True, the weights are read-only np.memmap views of the file, so that many worker processes share one
+            copy in the page cache (inference only). Otherwise the weights are read into writable arrays.
+        '''
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(str(path) + ' is not a file saved with Sequential.export.')
+            length, = struct.unpack('<Q', file.read(8))
+            header = json.loads(file.read(length).decode('utf-8'))
+        start = -(-(len(MAGIC) + 8 + length)//ALIGNMENT)*ALIGNMENT
+        if header['size'] == 0:
+            blob = np.empty(0, dtype=np.uint8)
+        elif mmap:
+            blob = np.memmap(path, dtype=np.uint8, mode='r', offset=start, shape=(header['size'],))
+        else:
+            blob = np.fromfile(path, dtype=np.uint8, offset=start, count=header['size'])
+
+        layers = {layer.__name__:layer for layer in LAYERS}
+        activations = {activation.__name__:activation for activation in ACTIVATIONS}
+        model = cls()
+        for entry in header['layers']:
+            config = dict(entry['config'])
+            if 'activation' in config:
+                config['activation'] = activations[config['activation']]()
+            layer = layers[entry['type']](**config)
+            if entry['params']:
+                params = {}
+                for key, param in entry['params'].items():
+                    dtype = np.dtype(param['dtype'])
+                    size = int(np.prod(param['shape'])) * dtype.itemsize
+                    params[key] = blob[param['offset']:param['offset']+size].view(dtype).reshape(param['shape'])
+                layer.set_params(params)
+            model.add(layer)
+        return model
     
     def load_weight(self, filename="weight.hdf5"):
         file = h5.File(filename, 'r')
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+class BatchServer:
+    '''Asynchronous inference server with dynamic request batching
+    Requests of the concurrent clients are queued per model and coalesced into one batch, until the batch has
+    max_batch_size samples or the oldest request has waited max_latency seconds. A request that would overflow
+    the batch starts the next one, and a request larger than max_batch_size runs alone. One predict is run per batch
+    in a worker thread and the results are scattered back to the awaiting clients.
+
+    ## Arguments
+    models: Dictionary of the models to serve {name: model}, each model must have predict (e.g. Sequential)
+    max_batch_size: Integer, the maximum number of samples in a batch
+    max_latency: Float, the maximum time (in seconds) a request waits for the batch to be filled
+
+    ## Usage
+        server = BatchServer({'vgg':model})
+        await server.start()
+        Y = await server.predict('vgg', X)    # X: (samples, ...)
+        await server.stop()
+    '''
+    def __init__(self, models, max_batch_size=32, max_latency=0.005):
+        self.models = models
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queues = {}
+        # a request that did not fit into the last batch starts the next one
+        self.pending = {}
+        self.tasks = {}
+        # layers keep their state during predict, so each model gets its own thread
+        self.executors = {}
+
+    async def start(self):
+        for name in self.models:
+            self.queues[name] = asyncio.Queue()
+            self.executors[name] = ThreadPoolExecutor(max_workers=1)
+            self.tasks[name] = asyncio.ensure_future(self.batcher(name))
+
+    async def stop(self):
+        '''Stops the batchers and fails all the requests in flight or still queued'''
+        for name in self.tasks:
+            self.tasks[name].cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        for name in self.queues:
+            requests = []
+            if name in self.pending:
+                requests.append(self.pending.pop(name))
+            while not self.queues[name].empty():
+                requests.append(self.queues[name].get_nowait())
+            self.fail(requests, RuntimeError('The server was stopped.'))
+        # do not block the event loop on a predict still running in a worker thread
+        for name in self.executors:
+            self.executors[name].shutdown(wait=False, cancel_futures=True)
+        self.tasks = {}
+        self.queues = {}
+        self.pending = {}
+        self.executors = {}
+
+    async def predict(self, name, X):
+        '''Returns the prediction of the model name for X (samples, ...)'''
+        if name not in self.models:
+            raise KeyError('The model ' + str(name) + ' is not served.')
+        if name not in self.queues:
+            raise RuntimeError('The server is not running. Call start first.')
+        X = np.asarray(X)
+        if X.ndim < 1:
+            raise ValueError('The input must have the sample axis (samples, ...). Given shape: ' + str(X.shape))
+        future = asyncio.get_running_loop().create_future()
+        await self.queues[name].put((X, future))
+        return await future
+
+    async def batcher(self, name):
+        queue = self.queues[name]
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = []
+            try:
+                requests.append(self.pending.pop(name) if name in self.pending else await queue.get())
+                size = len(requests[0][0])
+                deadline = time.monotonic() + self.max_latency
+                while size < self.max_batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if size + len(request[0]) > self.max_batch_size:
+                        self.pending[name] = request
+                        break
+                    requests.append(request)
+                    size += len(request[0])
+                results = await loop.run_in_executor(self.executors[name], self.run, self.models[name], [X for X, _ in requests])
+            except asyncio.CancelledError:
+                # stopped while collecting or running a batch
+                self.fail(requests, RuntimeError('The server was stopped.'))
+                raise
+            except Exception as e:
+                # only the requests of this batch fail, the batcher keeps serving
+                self.fail(requests, e)
+                continue
+            for (_, future), result in zip(requests, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def fail(self, requests, error):
+        for _, future in requests:
+            if not future.done():
+                future.set_exception(error)
+
+    def run(self, model, inputs):
+        '''Runs one predict for all the inputs and splits the result (runs in the worker thread)'''
+        try:
+            Y = model.predict(np.concatenate(inputs))
+            return np.split(Y, np.cumsum([len(X) for X in inputs])[:-1])
+        except Exception:
+            # the inputs can not be batched (e.g. different shapes), so run them one by one to isolate the errors
+            results = []
+            for X in inputs:
+                try:
+                    results.append(model.predict(X))
+                except Exception as e:
+                    results.append(e)
+            return results
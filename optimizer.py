@@ -1,6 +1,24 @@
 import numpy as np
 
-class SGD:
+class Optimizer:
+    """Base of the optimizers
+    learning_rate: Float, or a schedule in schedule.py that is called with the number of steps taken so far.
+    The schedule is consulted at every step, so changing the learning rate never rebuilds the state of the optimizer.
+    """
+    def __init__(self, learning_rate=0.01):
+        self.learning_rate = learning_rate
+        self.iterations = 0
+
+    def rate(self):
+        '''Returns the learning rate of the current step and advances the step'''
+        if callable(self.learning_rate):
+            lr = self.learning_rate(self.iterations)
+        else:
+            lr = self.learning_rate
+        self.iterations += 1
+        return lr
+
+class SGD(Optimizer):
     """Stochastic gradient descent (SGD)
     SGD and its variants are probably the most used optimization algorithms for machine learning in general and for deep learning in particular.
     Require: Learning rate ε
@@ -13,14 +31,15 @@ class SGD:
         end while
     """
     def __init__(self, learning_rate=0.01):
-        self.learning_rate = learning_rate
+        super().__init__(learning_rate)
     
     def optimize(self, parameter, gradient):
+        lr = self.rate()
         for i in parameter:
-            parameter[i]['weight'] -= self.learning_rate * gradient[i]['weight']
-            parameter[i]['bias'] -= self.learning_rate * gradient[i]['bias']
+            parameter[i]['weight'] -= lr * gradient[i]['weight']
+            parameter[i]['bias'] -= lr * gradient[i]['bias']
 
-class Momentum:
+class Momentum(Optimizer):
     """The method of momentum (Polyak, 1964)
     This method is designed to accelerate learning, especially in the face of high curvature, small but consistent gradients, or noisy gradients.
     Require: Learning rate ε, momentum parameter α.
@@ -30,25 +49,25 @@ class Momentum:
         \t    Sample a minibatch of m examples from the training set {x_1,...,x_m} with coresponding targets y_i \n
         \t    Compute gradient: g ← (1/m)*∇_θSum(L(f(x;θ),y)) \n
         \t    Compute velocity update:  v ← αv - εg \n
-        \t    Apply update: θ ← θ - v \n
+        \t    Apply update: θ ← θ + v \n
         end while
     """
     def __init__(self,learning_rate=0.01, momentum=0.9):
-        self.learning_rate = learning_rate
+        super().__init__(learning_rate)
         self.momentum = momentum
         self.velocity = {}
 
     def optimize(self, parameter, gradient):
+        lr = self.rate()
         for i in parameter:
             if not i in self.velocity.keys():
-                self.velocity[i]['weight'] = np.zeros_like(parameter[i]['weight'])
-                self.velocity[i]['bias'] = np.zeros_like(parameter[i]['bias'])
-            self.velocity[i]['weight'] = self.momentum * self.velocity[i]['weight'] - self.learning_rate * gradient[i]['weight']
-            self.velocity[i]['bias'] = self.momentum * self.velocity[i]['bias'] - self.learning_rate * gradient[i]['bias']
-            parameter[i]['weight'] -= self.velocity[i]['weight']
-            parameter[i]['bias'] -= self.velocity[i]['bias']
+                self.velocity[i] = {'weight':np.zeros_like(parameter[i]['weight']), 'bias':np.zeros_like(parameter[i]['bias'])}
+            self.velocity[i]['weight'] = self.momentum * self.velocity[i]['weight'] - lr * gradient[i]['weight']
+            self.velocity[i]['bias'] = self.momentum * self.velocity[i]['bias'] - lr * gradient[i]['bias']
+            parameter[i]['weight'] += self.velocity[i]['weight']
+            parameter[i]['bias'] += self.velocity[i]['bias']
             
-class AdaGrad:
+class AdaGrad(Optimizer):
     """AdaGrad algorithm (Duchi et al., 2011)
     Require: Global learning rate ε
     Require: Initial parameter θ.
@@ -64,16 +83,16 @@ class AdaGrad:
         end while
     """
     def __init__(self, learning_rate=0.01):
-        self.learning_rate = learning_rate
+        super().__init__(learning_rate)
         self.δ = 10e-7
         self.r = {}
     
     def optimize(self, parameter, gradient):
+        lr = self.rate()
         for i in parameter:
             if not i in self.r.keys():
-                self.r[i]['weight'] = np.zeros_like(gradient[i]['weight'])
-                self.r[i]['bias'] = np.zeros_like(gradient[i]['bias'])
+                self.r[i] = {'weight':np.zeros_like(parameter[i]['weight']), 'bias':np.zeros_like(parameter[i]['bias'])}
             self.r[i]['weight'] += np.square(gradient[i]['weight'])
             self.r[i]['bias'] += np.square(gradient[i]['bias'])
-            parameter[i]['weight'] -= np.multiply(self.learning_rate/(self.δ + np.sqrt(self.r[i]['weight'])), gradient[i]['weight'])
-            parameter[i]['bias'] -= np.multiply(self.learning_rate/(self.δ + np.sqrt(self.r[i]['bias'])), gradient[i]['bias'])
+            parameter[i]['weight'] -= np.multiply(lr/(self.δ + np.sqrt(self.r[i]['weight'])), gradient[i]['weight'])
+            parameter[i]['bias'] -= np.multiply(lr/(self.δ + np.sqrt(self.r[i]['bias'])), gradient[i]['bias'])
@@ -0,0 +1,94 @@
+import math
+
+class Schedule:
+    """Learning rate schedule
+    The optimizers in optimizer.py call the schedule with the number of steps taken so far and use the returned learning rate.
+    update is fed with the validation metrics by Sequential.fit (only used by ReduceOnPlateau).
+    """
+    def __call__(self, step):
+        raise NotImplementedError
+    def update(self, metric):
+        pass
+
+class StepDecay(Schedule):
+    """Multiplies the learning rate by gamma every step_size steps
+    lr = initial * gamma^(step//step_size)
+    """
+    def __init__(self, initial=0.01, step_size=1000, gamma=0.1):
+        self.initial = initial
+        self.step_size = step_size
+        self.gamma = gamma
+    def __call__(self, step):
+        return self.initial * self.gamma**(step//self.step_size)
+
+class CosineDecay(Schedule):
+    """Cosine annealing from initial to minimum in decay_steps steps (Loshchilov & Hutter, 2017)
+    lr = minimum + (initial - minimum) * (1 + cos(π*step/decay_steps))/2
+    """
+    def __init__(self, initial=0.01, decay_steps=10000, minimum=0.0):
+        self.initial = initial
+        self.decay_steps = decay_steps
+        self.minimum = minimum
+    def __call__(self, step):
+        step = min(step, self.decay_steps)
+        return self.minimum + (self.initial - self.minimum) * (1.0 + math.cos(math.pi*step/self.decay_steps))/2.0
+
+class Warmup(Schedule):
+    """Linear warmup from zero for warmup_steps steps, then the schedule (or the fixed learning rate) after
+    The schedule after the warmup starts from its step 0.
+    """
+    def __init__(self, after=0.01, warmup_steps=1000):
+        self.after = after
+        self.warmup_steps = warmup_steps
+    def __call__(self, step):
+        if step < self.warmup_steps:
+            return self.rate(0) * (step + 1)/self.warmup_steps
+        return self.rate(step - self.warmup_steps)
+    def rate(self, step):
+        return self.after(step) if callable(self.after) else self.after
+    def update(self, metric):
+        if isinstance(self.after, Schedule):
+            self.after.update(metric)
+
+class Plateau:
+    """Tracks the best value of a streamed metric
+    mode: One of 'min' and 'max', whether a smaller or a larger metric is better
+    min_delta: Float, the minimum change counted as an improvement
+    """
+    def __init__(self, mode='min', min_delta=0.0):
+        if mode not in ('min', 'max'):
+            raise ValueError('mode must be one of \'min\' and \'max\'. Given: ' + str(mode))
+        self.mode = mode
+        self.min_delta = min_delta
+        self.best = None
+        # the number of updates since the last improvement
+        self.wait = 0
+    def update(self, metric):
+        '''Returns True if the metric improved'''
+        if self.best is None or (metric < self.best - self.min_delta if self.mode == 'min' else metric > self.best + self.min_delta):
+            self.best = metric
+            self.wait = 0
+            return True
+        self.wait += 1
+        return False
+
+class ReduceOnPlateau(Schedule):
+    """Multiplies the learning rate by factor when the validation metric has not improved for patience updates
+    initial: Float, the initial learning rate
+    factor: Float, the factor of the reduction
+    patience: Integer, the number of updates without improvement before the reduction
+    minimum: Float, the lower bound of the learning rate
+    mode, min_delta: see Plateau
+    """
+    def __init__(self, initial=0.01, factor=0.1, patience=10, minimum=0.0, mode='min', min_delta=0.0):
+        self.lr = initial
+        self.factor = factor
+        self.patience = patience
+        self.minimum = minimum
+        self.plateau = Plateau(mode, min_delta)
+    def __call__(self, step):
+        return self.lr
+    def update(self, metric):
+        if not self.plateau.update(metric) and self.plateau.wait >= self.patience:
+            self.lr = max(self.lr * self.factor, self.minimum)
+            self.plateau.wait = 0